@@ -3,7 +3,7 @@
 import logging
 import math
 from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Callable, Iterable, List, Optional, Type, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type, Union
 
 import numpy
 import torch
@@ -51,6 +51,9 @@ class BlendedMegatronDatasetBuilder(object):
         self.is_built_on_rank = is_built_on_rank
         self.config = config
 
+        # LowLevelDataset per dataset path, shared by every split built from that path
+        self.low_level_datasets: Dict[Optional[str], LowLevelDataset] = {}
+
         log_single_rank(
             logger,
             logging.INFO,
@@ -186,8 +189,8 @@ class BlendedMegatronDatasetBuilder(object):
 
             split = self.config.split_matrix
 
-            # Blend consists of a single prefix
-            if len(prefixes) == 1 and weights is None:
+            # Blend consists of a single prefix, so its weight is trivial
+            if len(prefixes) == 1:
                 return self._build_megatron_dataset_splits(prefixes[0], split, self.sizes)
 
             # Build the mid-level datasets
@@ -413,8 +416,12 @@ class BlendedMegatronDatasetBuilder(object):
                     torch.distributed.barrier()
             return [None] * len(Split)
 
-        # Build the low level dataset
-        low_level_dataset = self.cls.build_low_level_dataset(dataset_path, self.config)
+        # Build the low level dataset, or reuse it if already built for this path
+        if dataset_path in self.low_level_datasets:
+            low_level_dataset = self.low_level_datasets[dataset_path]
+        else:
+            low_level_dataset = self.cls.build_low_level_dataset(dataset_path, self.config)
+            self.low_level_datasets[dataset_path] = low_level_dataset
 
         # Build the split indices for the low level dataset
         num_elements = self.cls.numel_low_level_dataset(low_level_dataset)
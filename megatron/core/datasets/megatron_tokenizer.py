@@ -57,6 +57,20 @@ class MegatronTokenizer(ABC):
         """
         raise NotImplementedError("{} has no method 'detokenize'".format(type(self).__name__))
 
+    def batch_detokenize(self, ids_list: list[numpy.ndarray]) -> list[str]:
+        """Convert a batch of embedding ids to text
+
+        Args:
+            ids_list (list[numpy.ndarray]): The ids to convert, one sequence per text
+
+        Returns:
+            list[str]: The converted texts
+
+        Raises:
+            NotImplementedError: If 'detokenize' is not implemented
+        """
+        return [self.detokenize(ids) for ids in ids_list]
+
     def offsets(self, ids: list[int], text: str) -> list[int]:
         """Convert embedding ids to text offsets
 
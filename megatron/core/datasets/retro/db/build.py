@@ -25,8 +25,10 @@ from megatron.core.datasets.indexed_dataset import IndexedDataset
 from megatron.core.datasets.retro.config import RetroPreprocessingConfig
 from megatron.core.datasets.retro.external_libs import h5py
 from megatron.core.datasets.retro.utils import (
+    Block,
     extract_data_config,
     get_blocks_by_rank,
+    iter_rank_blocks,
     log_retro_rank_0,
     retro_makedir,
 )
@@ -52,7 +54,7 @@ def build_partial_db(
     indexed_dataset: IndexedDataset,
     block_id: int,
     n_blocks: int,
-    block: dict,
+    block: Block,
     proc_id: int,
     n_procs: int,
 ) -> Tuple[int, list, list, dict]:
@@ -70,7 +72,7 @@ def build_partial_db(
         indexed_dataset (IndexedDataset): Indexed dataset to be chunked.
         block_id (int): Block index out of all blocks to be processed.
         n_blocks (int):  Total number of blocks to be processed.
-        block (dict): Range information such as start/end points for chunking idnexed dataset.
+        block (Block): Range information such as start/end points for chunking idnexed dataset.
         proc_id (int): Process ID for tracking parallel process order.
         n_procs (int): Total number of parallel processes.
 
@@ -171,7 +173,7 @@ def build_block_db(
     executor: ProcessPoolExecutor,
     n_missing_blocks: int,
     block_idx: int,
-    block: dict,
+    block: Block,
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """Split each document within block into consecutive retro_gpt_chunk_length size chunks.
 
@@ -184,7 +186,7 @@ def build_block_db(
         executor (ProcessPoolExecutor): Executor for launching parallel processes.
         n_missing_blocks (int):  Total number of blocks to be processed.
         block_idx (int): Block index out of all blocks to be processed.
-        block (dict): Range information such as start/end points for chunking idnexed dataset.
+        block (Block): Range information such as start/end points for chunking idnexed dataset.
 
     Returns:
         A tuple containing:
@@ -250,13 +252,13 @@ def build_block_db(
 
 
 def save_block_db(
-    block: dict, chunk_db_valid: np.ndarray, chunk_db_invalid: np.ndarray, doc_offsets: np.ndarray
+    block: Block, chunk_db_valid: np.ndarray, chunk_db_invalid: np.ndarray, doc_offsets: np.ndarray
 ) -> None:
     """Save block of chunked tokens to disk. These blocks are later used for
     training and adding to the vector index.
 
     Args:
-        block (dict): Range information such as start/end points for chunking idnexed dataset.
+        block (Block): Range information such as start/end points for chunking idnexed dataset.
         chunk_db_valid (np.ndarray): Array of valid chunk indexes.
         chunk_db_invalid (np.ndarray): Array of invalid chunk indexes.
         doc_offsets (np.ndarray): Array of document offsets by chunks.
@@ -297,15 +299,18 @@ def build_individual_db(
     )
     if config.retro_task_validate is None:
         active_blocks = blocks.missing
+        n_active_blocks_per_rank = blocks.n_missing_per_rank
     else:
         assert blocks.n_missing_world == 0
         active_blocks = blocks.existing
+        n_active_blocks_per_rank = blocks.n_existing_per_rank
+    n_active_blocks = max(n_active_blocks_per_rank, default=0)
 
     # Prevent missing-path-write race condition.
     torch.distributed.barrier()
 
     # Nothing to do?
-    if config.retro_task_validate is None and not active_blocks:
+    if config.retro_task_validate is None and n_active_blocks == 0:
         return
 
     # Num processes.
@@ -322,7 +327,9 @@ def build_individual_db(
 
     # Process documents in parallel.
     with ProcessPoolExecutor(max_workers=n_procs) as executor:
-        for block_idx, block in enumerate(active_blocks):
+        for block_idx, block in enumerate(
+            iter_rank_blocks(active_blocks, n_active_blocks_per_rank)
+        ):
 
             if block is not None:
 
@@ -334,7 +341,7 @@ def build_individual_db(
                     indexed_dataset=indexed_dataset,
                     n_procs=n_procs,
                     executor=executor,
-                    n_missing_blocks=len(active_blocks),
+                    n_missing_blocks=n_active_blocks,
                     block_idx=block_idx,
                     block=block,
                 )
@@ -21,8 +21,10 @@ from megatron.core.datasets.retro.config import Embedder, RetroPreprocessingConf
 from megatron.core.datasets.retro.external_libs import faiss, h5py
 from megatron.core.datasets.retro.index.utils import get_added_code_paths, get_added_codes_dir
 from megatron.core.datasets.retro.utils import (
+    Block,
     GPTToTextDataset,
     get_blocks_by_rank,
+    iter_rank_blocks,
     log_retro_rank_0,
     retro_makedir,
 )
@@ -39,7 +41,7 @@ class FaissParallelAddIndex(FaissBaseIndex):
     """
 
     def encode_block(
-        self, index: faiss.Index, embedder: Embedder, text_dataset: GPTToTextDataset, block: dict
+        self, index: faiss.Index, embedder: Embedder, text_dataset: GPTToTextDataset, block: Block
     ) -> Tuple[np.ndarray, np.ndarray]:
         """Encode sub-dataset block, to be later added to index.
 
@@ -51,7 +53,7 @@ class FaissParallelAddIndex(FaissBaseIndex):
             index (faiss.Index): Faiss index object.
             embedder (Embedder): Embedder used to embed text dataset.
             text_dataset (GPTToTextDataset): Text dataset to be embedded and encoded.
-            block (dict): Range information specifying start/end indices within text dataset.
+            block (Block): Range information specifying start/end indices within text dataset.
 
         Returns:
             A tuple of (embeddings, encodings) for the given block subset of the text dataset.
@@ -67,12 +69,12 @@ class FaissParallelAddIndex(FaissBaseIndex):
         # Return embeddings for validation purposes.
         return embeddings, codes
 
-    def save_block(self, config: RetroPreprocessingConfig, block: dict, codes: np.ndarray) -> None:
+    def save_block(self, config: RetroPreprocessingConfig, block: Block, codes: np.ndarray) -> None:
         """Save block of codes to disk.
 
         Args:
             config (RetroPreprocessingConfig): Retro preprocessing config.
-            block (dict): Range information specifying the start/end indices within the encoded text dataset. Here, the 'path' item is used for writing the encodings to storage.
+            block (Block): Range information specifying the start/end indices within the encoded text dataset. Here, the 'path' item is used for writing the encodings to storage.
             codes (np.ndarray): Block of encodings to be saved to storage.
         """
         # Save neighbors.
@@ -112,14 +114,16 @@ class FaissParallelAddIndex(FaissBaseIndex):
         )
 
         # Encode each block.
-        for block_index, block in enumerate(blocks.missing):
+        n_missing_blocks = max(blocks.n_missing_per_rank, default=0)
+        for block_index, block in enumerate(
+            iter_rank_blocks(blocks.missing, blocks.n_missing_per_rank)
+        ):
 
             if block is not None:
 
                 # Progress.
                 log_retro_rank_0(
-                    "encode block %d / %d ... %s."
-                    % (block_index, len(blocks.missing), block["path"])
+                    "encode block %d / %d ... %s." % (block_index, n_missing_blocks, block["path"])
                 )
 
                 # Encode and save.
@@ -25,6 +25,7 @@ from megatron.core.datasets.retro.external_libs import h5py
 from megatron.core.datasets.retro.utils import (
     GPTToTextDataset,
     get_blocks_by_rank,
+    iter_rank_blocks,
     log_retro_rank_0,
 )
 
@@ -65,16 +66,19 @@ def validate_training_embeddings(config: RetroPreprocessingConfig) -> None:
 
     # Embed & validate blocks.
     embedder = config.retro_bert_embedders.mem
-    for block_idx, block in enumerate(blocks.existing):
+    n_existing_blocks = max(blocks.n_existing_per_rank, default=0)
+    for block_idx, block in enumerate(
+        iter_rank_blocks(blocks.existing, blocks.n_existing_per_rank)
+    ):
 
-        # Missing block lists are extended with None to have equal-length
-        # lists. Skip the Nones.
+        # Block iteration is padded with None to have equal-length iteration
+        # across ranks. Skip the Nones.
         if block is not None:
 
             # Progress. (*note*: move world progress to here.)
             log_retro_rank_0(
                 "embed training block %d / %d ... %s."
-                % (block_idx, len(blocks.existing), block["path"])
+                % (block_idx, n_existing_blocks, block["path"])
             )
 
             # Load existing block embeddings.
@@ -141,13 +145,16 @@ def validate_added_encodings(config: RetroPreprocessingConfig) -> None:
 
     # Encode and validate blocks.
     embedder = config.retro_bert_embedders.mem
-    for block_idx, block in enumerate(blocks.existing):
+    n_existing_blocks = max(blocks.n_existing_per_rank, default=0)
+    for block_idx, block in enumerate(
+        iter_rank_blocks(blocks.existing, blocks.n_existing_per_rank)
+    ):
 
         if block is not None:
 
             # Progress.
             log_retro_rank_0(
-                "encode block %d / %d ... %s." % (block_idx, len(blocks.existing), block["path"])
+                "encode block %d / %d ... %s." % (block_idx, n_existing_blocks, block["path"])
             )
 
             # Load existing codes.
@@ -91,14 +91,16 @@ def build_gpt_chunk_datasets_from_gpt_datasets(
         A <dict> ?
     """
 
+    # Validate chunk length once, for all splits.
+    n_chunks_per_sample = get_num_chunks_per_sample(sample_length, chunk_length)
+
     # GPT chunk datasets.
     chunk_datasets = {
         key: (
             {
                 "dataset": GPTChunkDataset(sample_ds, sample_length, chunk_length),
                 "neighbor_dir": get_neighbor_dir(project_dir, key, sample_ds),
-                "num_active_chunks": num_active_samples
-                * get_num_chunks_per_sample(sample_length, chunk_length),
+                "num_active_chunks": num_active_samples * n_chunks_per_sample,
             }
             if sample_ds
             else None
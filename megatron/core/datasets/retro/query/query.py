@@ -30,8 +30,10 @@ from megatron.core.datasets.retro.index.index import Index
 from megatron.core.datasets.retro.index.utils import get_index_dir
 from megatron.core.datasets.retro.query.gpt_chunk_dataset import GPTChunkDataset
 from megatron.core.datasets.retro.utils import (
+    Block,
     GPTToTextDataset,
     get_blocks_by_rank,
+    iter_rank_blocks,
     log_retro_rank_0,
     retro_makedir,
 )
@@ -67,14 +69,14 @@ def get_index(config: RetroPreprocessingConfig, ondisk: bool = False) -> faiss.I
 
 
 def embed_block(
-    config: RetroPreprocessingConfig, gpt_dataset: GPTChunkDataset, block: dict
+    config: RetroPreprocessingConfig, gpt_dataset: GPTChunkDataset, block: Block
 ) -> np.ndarray:
     """Embed block of chunks.
 
     Args:
         config (RetroPreprocessingConfig): Retro preprocessing config.
         gpt_dataset (GPTChunkDataset): Chunk dataset to be embedded.
-        block (dict): Range information containing start/end indices of subset of chunk dataset.
+        block (Block): Range information containing start/end indices of subset of chunk dataset.
 
     Returns:
         Embeddings array, with shape (len(block["range"]), dimension(embedder)).
@@ -227,7 +229,7 @@ def query_block_neighbors(
     db_dataset: DBDataset,
     query_dataset: GPTChunkDataset,
     index: Index,
-    block: dict,
+    block: Block,
 ) -> None:
     """Query neighbors of a dataset block (i.e., range).
 
@@ -236,7 +238,7 @@ def query_block_neighbors(
         db_dataset (DBDataset): Dataset containing chunk database entries.
         query_dataset (GPTChunkDataset): GPT chunk dataset to be queried.
         index (Index): Vector index populated with chunk database indices.
-        block (dict): Range information containing start/end indices for querying GPT chunk dataset.
+        block (Block): Range information containing start/end indices for querying GPT chunk dataset.
     """
 
     n_chunks_per_sample = query_dataset.n_chunks_per_sample
@@ -313,6 +315,7 @@ def query_dataset_neighbors(
             neighbor_dir, num_active_chunks, config.retro_block_size, validate=validate
         )
         active_blocks = blocks.missing
+        n_active_blocks_per_rank = blocks.n_missing_per_rank
     else:
         blocks = get_blocks_by_rank(
             neighbor_dir,
@@ -323,9 +326,11 @@ def query_dataset_neighbors(
         )
         assert blocks.n_missing_world == 0
         active_blocks = blocks.existing
+        n_active_blocks_per_rank = blocks.n_existing_per_rank
 
     # Query each block.
-    for block_index, block in enumerate(active_blocks):
+    n_active_blocks = max(n_active_blocks_per_rank, default=0)
+    for block_index, block in enumerate(iter_rank_blocks(active_blocks, n_active_blocks_per_rank)):
 
         if block is not None:
 
@@ -336,7 +341,7 @@ def query_dataset_neighbors(
                     "" if config.retro_task_validate is None else "[validate] ",
                     prefix,
                     block_index,
-                    len(active_blocks),
+                    n_active_blocks,
                     os.path.basename(block["path"]),
                     psutil.virtual_memory()[3] / 1024**3,
                     psutil.virtual_memory()[2],
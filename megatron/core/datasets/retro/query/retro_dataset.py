@@ -103,9 +103,9 @@ class RetroDataset(torch.utils.data.Dataset):
         for chunk_idx in chunk_idxs:
 
             # Neighbor chunk ids.
-            neighbor_path = self.neighbor_path_map[chunk_idx]
+            neighbor_path, neighbor_key = self.neighbor_path_map.get_block_key(chunk_idx)
             with h5py.File(neighbor_path, "r") as f:
-                neighbor_chunk_ids = f["neighbors"][
+                neighbor_chunk_ids = f[neighbor_key]["neighbors"][
                     chunk_idx % self.block_size, : self.num_neighbors
                 ].tolist()
 
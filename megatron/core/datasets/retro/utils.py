@@ -2,12 +2,11 @@
 
 """Utilities for Retro preprocessing."""
 
-import glob
 import logging
 import os
 from collections import defaultdict
 from types import SimpleNamespace
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -58,6 +57,20 @@ def extract_data_config(config: RetroPreprocessingConfig) -> MultiSplitGPTDatase
     return config.retro_gpt_chunk_datasets.train["dataset"].sample_dataset.config
 
 
+def get_collective_device() -> torch.device:
+    """Get the device for tensors used in collectives.
+
+    Retro preprocessing may run with a CPU-only (gloo) process group, in which
+    case collectives on CPU tensors avoid host-device copies and syncs.
+
+    Returns:
+        The CPU device for a gloo process group, or the current CUDA device otherwise.
+    """
+    if torch.distributed.get_backend() == torch.distributed.Backend.GLOO:
+        return torch.device("cpu")
+    return torch.device("cuda", torch.cuda.current_device())
+
+
 def get_num_chunks_per_sample(sample_length: int, chunk_length: int) -> int:
     """Compute seq_length // chunk_length.
 
@@ -108,6 +121,65 @@ class GPTToTextDataset(torch.utils.data.Dataset):
         text = self.gpt_tokenizer.detokenize(gpt_token_ids)
         return {"text": text}
 
+    def __getitems__(self, idxs: List[int]) -> List[dict]:
+        """Get a batch of dataset samples.
+
+        Used by the torch DataLoader for batched fetching. If the tokenizer
+        supports batched detokenization, all samples are decoded in a single
+        call; otherwise, each sample is decoded individually.
+
+        Args:
+            idxs (List[int]): Indexes of samples.
+
+        Returns:
+            A list of dicts, each containing attribute 'text' of type string.
+        """
+        batch_detokenize = getattr(self.gpt_tokenizer, "batch_detokenize", None)
+        if batch_detokenize is None:
+            return [self[idx] for idx in idxs]
+        gpt_token_ids = [self.gpt_dataset[idx]["text"].tolist() for idx in idxs]
+        return [{"text": text} for text in batch_detokenize(gpt_token_ids)]
+
+
+class Block:
+    """A block of samples, and the path of its block file.
+
+    Blocks are created for every block file of a directory, so attributes are
+    stored in slots rather than a per-instance dict. For compatibility with
+    dict-style access, `block["range"]` and `block["path"]` are also supported.
+
+    Args:
+        block_range (Tuple[int, int]): Sample range [start_idx, end_idx) of the block, stored as `range`.
+        path (str): Path to the block file.
+    """
+
+    __slots__ = ("range", "path")
+
+    def __init__(self, block_range: Tuple[int, int], path: str):
+        self.range = block_range
+        self.path = path
+
+    def __getitem__(self, key: str) -> Any:
+        """Get attribute by name.
+
+        Args:
+            key (str): Attribute name, 'range' or 'path'.
+
+        Returns:
+            The attribute value.
+        """
+        if key not in Block.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self) -> str:
+        """Stringify the block.
+
+        Returns:
+            A string representation of this block.
+        """
+        return "Block(range=%s, path='%s')" % (self.range, self.path)
+
 
 def get_blocks(
     dirname: str, n_samples: int, block_size: int, validate: Callable = None
@@ -133,56 +205,105 @@ def get_blocks(
 
     assert os.path.isdir(dirname), "missing directory '%s.'" % dirname
 
-    # Block ranges.
-    block_start_idxs = list(range(0, n_samples, block_size))
-    block_end_idxs = [min(n_samples, i + block_size) for i in block_start_idxs]
-    block_ranges = list(zip(block_start_idxs, block_end_idxs))
-
-    # All block files (existing + missing).
-    n_digits = int(np.ceil(np.log(n_samples) / np.log(10)) + 1)
-    all_blocks = [
-        {
-            "range": r,
-            "path": os.path.join(
-                dirname, "%s-%s.hdf5" % tuple([str(i).zfill(n_digits) for i in r])
-            ),
-        }
-        for r in block_ranges
-    ]
-    all_block_path_set = set(block["path"] for block in all_blocks)
+    # Block ranges, as an (n_blocks, 2) array of [start_idx, end_idx).
+    block_start_idxs = np.arange(0, n_samples, block_size, dtype=np.int64)
+    block_end_idxs = np.minimum(block_start_idxs + block_size, n_samples)
+    block_ranges = np.stack([block_start_idxs, block_end_idxs], axis=1)
+
+    # All block files (existing + missing). Paths are formatted as
+    # '{dirname}/{start_idx}-{end_idx}.hdf5', in one vectorized pass.
+    # Zero-padding width is ceil(log10(n_samples)) + 1, computed exactly with
+    # integer arithmetic to keep existing block file names unchanged.
+    n_digits = len(str(n_samples - 1)) + 1 if n_samples > 1 else 1
+    block_start_strs = np.char.zfill(block_start_idxs.astype(str), n_digits)
+    block_end_strs = np.char.zfill(block_end_idxs.astype(str), n_digits)
+    block_stems = np.char.add(np.char.add(block_start_strs, "-"), block_end_strs)
+    block_names = np.char.add(block_stems, ".hdf5")
+    block_paths = np.char.add(os.path.join(dirname, ""), block_names).tolist()
+    block_names = block_names.tolist()
 
     # Validate function.
     validate = (lambda f: None) if validate is None else validate
 
-    # Delete corrupt files.
-    if torch.distributed.get_rank() == 0:
-        existing_block_paths = [
-            block["path"] for block in all_blocks if os.path.exists(block["path"])
-        ]
-        for index, path in enumerate(tqdm(existing_block_paths, "validating block.")):
+    # Existence of each block file. Rank 0 lists 'dirname' once and broadcasts
+    # the resulting mask, rather than every rank querying the shared filesystem.
+    rank = torch.distributed.get_rank()
+    world_size = torch.distributed.get_world_size()
+    device = get_collective_device()
+    if rank == 0:
+        dir_names = {e.name for e in os.scandir(dirname) if e.name.endswith(".hdf5")}
+        exists_mask = np.fromiter(
+            (name in dir_names for name in block_names), dtype=np.uint8, count=len(block_names)
+        )
+        exists_tensor = torch.from_numpy(exists_mask).to(device)
+    else:
+        exists_tensor = torch.empty(len(block_names), dtype=torch.uint8, device=device)
+    torch.distributed.broadcast(exists_tensor, 0)
+    exists_mask = exists_tensor.cpu().numpy().astype(bool)
+
+    def is_corrupt(block_idx: int) -> bool:
+        """Check if a block file fails to open or validate.
 
-            assert path in all_block_path_set, "unexpected filename, '%s'." % path
+        Args:
+            block_idx (int): Index of block.
 
-            try:
-                f = h5py.File(path, "r")
-            except Exception:
-                os.remove(path)
-                continue
+        Returns:
+            True if the block file is corrupt.
+        """
+        # Validation only inspects metadata, so skip the raw data chunk cache.
+        try:
+            f = h5py.File(
+                block_paths[block_idx], "r", libver="latest", rdcc_nbytes=0, rdcc_nslots=1
+            )
+        except Exception:
+            return True
+        try:
+            validate(f)
+        except Exception:
+            return True
+        finally:
+            f.close()
+        return False
+
+    # Validate existing files. Each rank validates an interleaved shard of the
+    # existing files, and the corrupt block indexes are gathered across all
+    # ranks.
+    rank_block_idxs = np.flatnonzero(exists_mask)[rank::world_size].tolist()
+    rank_corrupt_block_idxs = [
+        i for i in tqdm(rank_block_idxs, "validating block.", disable=rank != 0) if is_corrupt(i)
+    ]
+
+    world_corrupt_block_idxs = [None] * world_size
+    torch.distributed.all_gather_object(world_corrupt_block_idxs, rank_corrupt_block_idxs)
+    corrupt_block_idxs = [i for idxs in world_corrupt_block_idxs for i in idxs]
 
-            try:
-                validate(f)
-            except Exception:
-                os.remove(path)
-            finally:
-                f.close()
+    # Delete corrupt files.
+    if rank == 0:
+        for i in corrupt_block_idxs:
+            os.remove(block_paths[i])
+    exists_mask[corrupt_block_idxs] = False
 
     # Wait for files to be deleted.
     torch.distributed.barrier()
 
     # Collect blocks.
+    def get_block_list(idxs: np.ndarray) -> List[Block]:
+        """Create blocks from block indexes.
+
+        Args:
+            idxs (np.ndarray): Indexes into the block ranges and paths.
+
+        Returns:
+            List of blocks.
+        """
+        return [
+            Block(tuple(r), block_paths[i])
+            for i, r in zip(idxs.tolist(), block_ranges[idxs].tolist())
+        ]
+
     blocks = SimpleNamespace(
-        existing=[b for b in all_blocks if os.path.exists(b["path"])],
-        missing=[b for b in all_blocks if not os.path.exists(b["path"])],
+        existing=get_block_list(np.flatnonzero(exists_mask)),
+        missing=get_block_list(np.flatnonzero(~exists_mask)),
     )
 
     return blocks
@@ -210,7 +331,7 @@ def get_blocks_by_rank(
         sample (Optional[float]): If provided, sample a random subset of the blocks. Used for validating preprocessing correctness.
 
     Returns:
-        A namespace consisting of 2 lists: existing blocks, and missing blocks. Each of these two lists is potentially a sub-sample of the total set of existing and missing blocks, depending on whether sampling is used. Additionally, the attributes n_existing_world and n_missing_world are the total number of existing and missing blocks, independent of samples. Therefore, (n_existing_world + n_missing_world) * block_size == n_samples.
+        A namespace consisting of 2 lists: existing blocks, and missing blocks. Each of these two lists is potentially a sub-sample of the total set of existing and missing blocks, depending on whether sampling is used. Additionally, the attributes n_existing_world and n_missing_world are the total number of existing and missing blocks, independent of samples. Therefore, (n_existing_world + n_missing_world) * block_size == n_samples. The attributes n_existing_per_rank and n_missing_per_rank hold the (possibly sampled) list lengths on each rank, for use with `iter_rank_blocks()`.
     """
 
     # Get world blocks.
@@ -219,33 +340,21 @@ def get_blocks_by_rank(
     # This rank's existing and missing files.
     data_parallel_rank = parallel_state.get_data_parallel_rank()
     data_parallel_world_size = parallel_state.get_data_parallel_world_size()
-    rank_existing_blocks = blocks.existing[
-        data_parallel_rank : len(blocks.existing) : data_parallel_world_size
-    ]
-    rank_missing_blocks = blocks.missing[
-        data_parallel_rank : len(blocks.missing) : data_parallel_world_size
-    ]
-
-    # Extend rank's existing and missing blocks (with None) such that all ranks
-    # have equal length lists. This allows for easier tracking of global progress.
-    def get_world_max(n: int) -> int:
-        """Get max value across ranks.
-
-        Args:
-            n (int): Value on this rank.
-
-        Returns:
-            Max value across all ranks.
-        """
-        n_tensor = torch.cuda.LongTensor([n])
-        torch.distributed.all_reduce(n_tensor, op=torch.distributed.ReduceOp.MAX)
-        return n_tensor.item()
-
-    max_n_existing = get_world_max(len(rank_existing_blocks))
-    max_n_missing = get_world_max(len(rank_missing_blocks))
-
-    rank_existing_blocks += [None] * (max_n_existing - len(rank_existing_blocks))
-    rank_missing_blocks += [None] * (max_n_missing - len(rank_missing_blocks))
+    rank_existing_blocks = blocks.existing[data_parallel_rank::data_parallel_world_size]
+    rank_missing_blocks = blocks.missing[data_parallel_rank::data_parallel_world_size]
+
+    # Gather the number of existing and missing blocks on each rank, with a
+    # single collective. Rather than padding the rank lists to equal length,
+    # ranks iterate up to the world max via `iter_rank_blocks()`. This allows
+    # for easier tracking of global progress.
+    n_tensor = torch.tensor(
+        [len(rank_existing_blocks), len(rank_missing_blocks)],
+        dtype=torch.long,
+        device=get_collective_device(),
+    )
+    n_tensors = [torch.empty_like(n_tensor) for _ in range(torch.distributed.get_world_size())]
+    torch.distributed.all_gather(n_tensors, n_tensor)
+    n_existing_per_rank, n_missing_per_rank = torch.stack(n_tensors).t().tolist()
 
     # Collect blocks.
     blocks = SimpleNamespace(
@@ -253,38 +362,73 @@ def get_blocks_by_rank(
         n_missing_world=len(blocks.missing),
         existing=rank_existing_blocks,
         missing=rank_missing_blocks,
+        n_existing_per_rank=n_existing_per_rank,
+        n_missing_per_rank=n_missing_per_rank,
     )
 
     if sample is not None:
         # Sample existing and missing blocks evenly across all ranks. The
         # returned lists of blocks are randomly sampled (without replacement)
-        # to yield `sample * len(blocks)` number of blocks.
+        # to yield `sample * max(n_blocks_per_rank)` number of blocks per rank.
 
-        # Randomly sample blocks.
-        def sample_blocks(_blocks: List[Optional[Dict]]) -> List[Optional[Dict]]:
-            """Sample a random subset of all blocks.
+        blocks.existing, blocks.n_existing_per_rank = sample_blocks(
+            blocks.existing, blocks.n_existing_per_rank, sample
+        )
+        blocks.missing, blocks.n_missing_per_rank = sample_blocks(
+            blocks.missing, blocks.n_missing_per_rank, sample
+        )
 
-            Args:
-                _blocks (List[Optional[Dict]]): List of all blocks.
+    return blocks
 
-            Returns:
-                A random subset of the blocks.
-            """
-            n_blocks_sample = int(np.ceil(sample * len(_blocks)))
-            sampled_blocks: List[Optional[Dict]] = [b for b in _blocks if b is not None]
 
-            np.random.seed(None)
-            np.random.shuffle(sampled_blocks)
+def sample_blocks(
+    rank_blocks: List[Block], n_blocks_per_rank: List[int], sample: float
+) -> Tuple[List[Block], List[int]]:
+    """Sample a random subset of this rank's blocks.
 
-            sampled_blocks = sampled_blocks[:n_blocks_sample]
-            sampled_blocks += [None] * (n_blocks_sample - len(sampled_blocks))
+    Every rank samples (without replacement) up to `sample * max(n_blocks_per_rank)`
+    blocks, so the sampled number of blocks on each rank can be computed
+    locally, without further collectives.
 
-            return sampled_blocks
+    Args:
+        rank_blocks (List[Block]): This rank's blocks.
+        n_blocks_per_rank (List[int]): Number of blocks on each rank.
+        sample (float): Fraction of blocks to sample, relative to the rank with the most blocks.
+
+    Returns:
+        A random subset of this rank's blocks, and the sampled number of blocks on each rank.
+    """
+    n_blocks_sample = int(np.ceil(sample * max(n_blocks_per_rank, default=0)))
 
-        blocks.existing = sample_blocks(blocks.existing)
-        blocks.missing = sample_blocks(blocks.missing)
+    # Shuffle indexes rather than the blocks themselves, and only gather the
+    # sampled blocks.
+    rng = np.random.default_rng()
+    sample_idxs = rng.permutation(len(rank_blocks))[:n_blocks_sample]
+    sampled_blocks: List[Block] = [rank_blocks[i] for i in sample_idxs]
+    n_sampled_per_rank = [min(n, n_blocks_sample) for n in n_blocks_per_rank]
 
-    return blocks
+    return sampled_blocks, n_sampled_per_rank
+
+
+def iter_rank_blocks(
+    rank_blocks: List[Block], n_blocks_per_rank: List[int]
+) -> Iterator[Optional[Block]]:
+    """Iterate this rank's blocks in lockstep with all other ranks.
+
+    Every rank yields the same number of items, `max(n_blocks_per_rank)`, so
+    that per-block synchronization (e.g., barriers) lines up across ranks.
+    Once this rank's blocks are exhausted, None is yielded for the remaining
+    steps.
+
+    Args:
+        rank_blocks (List[Block]): This rank's blocks (e.g., `blocks.missing` from `get_blocks_by_rank()`).
+        n_blocks_per_rank (List[int]): Number of blocks on each rank (e.g., `blocks.n_missing_per_rank`).
+
+    Returns:
+        An iterator over this rank's blocks, padded with None.
+    """
+    for block_idx in range(max(n_blocks_per_rank, default=0)):
+        yield rank_blocks[block_idx] if block_idx < len(rank_blocks) else None
 
 
 class BlockPathMap:
@@ -297,35 +441,69 @@ class BlockPathMap:
     exception of the final block. Given an input index, this class maps the
     index to the containing block file.
 
+    Alternatively, the files may be consolidated (see `consolidate_blocks()`),
+    in which case each file spans several consecutive blocks, each stored in
+    its own HDF5 group. Use `get_block_key()` to get both the file path and the
+    group key of the block containing an index.
+
     Args:
         block_paths (List[str]): List of paths to saved block files.
-        block_size (int): Max number of samples per block file (e.g., 100000).
+        block_size (int): Max number of samples per block (e.g., 100000).
+        consolidated (Optional[bool]): Whether the block files are consolidated. If None, files are detected as consolidated if any file spans more than one block.
     """
 
     @classmethod
-    def from_dir(cls, dir: str, block_size: int, ext: str = "hdf5") -> Any:
+    def from_dir(
+        cls, dir: str, block_size: int, ext: str = "hdf5", consolidated: Optional[bool] = None
+    ) -> Any:
         """Get list of block files, and create map.
 
         Args:
             dir (str): Path to directory containing saved block files.
-            block_size (int): Max number of samples per block file (e.g., 100000).
+            block_size (int): Max number of samples per block (e.g., 100000).
             ext (str): Block file extension (e.g., 'hdf5').
+            consolidated (Optional[bool]): Whether the block files are consolidated. If None, this is detected from the file ranges.
 
         Returns:
             A mapping of sample index to block file path.
         """
         assert os.path.isdir(dir), f"directory not found, '{dir}'."
-        return cls(sorted(glob.glob(dir + f"/*.{ext}")), block_size)
+        # The map is keyed by start index, so paths need not be sorted.
+        block_paths = [e.path for e in os.scandir(dir) if e.name.endswith(f".{ext}")]
+        return cls(block_paths, block_size, consolidated)
 
-    def __init__(self, block_paths: List[str], block_size: int):
+    def __init__(
+        self, block_paths: List[str], block_size: int, consolidated: Optional[bool] = None
+    ):
         self.max_idx = 0
         self.block_path_map = {}
-        for block_path in block_paths:
-            name = os.path.splitext(os.path.basename(block_path))[0]
-            start_idx, end_idx = [int(i) for i in name.split("-")]
-            self.block_path_map[start_idx] = block_path
-            self.max_idx = max(self.max_idx, end_idx)
+        if len(block_paths) > 0:
+            # Parse 'startIdx-endIdx.[ext]' for all block names in one vectorized
+            # pass, rather than splitting and casting each name individually.
+            names = np.array([os.path.basename(p) for p in block_paths], dtype=str)
+            names = np.char.partition(names, ".")[..., 0]
+            idxs = np.char.partition(names, "-")
+            start_idxs = idxs[..., 0].astype(np.int64)
+            end_idxs = idxs[..., 2].astype(np.int64)
+
+            # Map the start index of every block within each file to that file.
+            # For non-consolidated files, each file holds exactly one block.
+            n_blocks_per_file = -((start_idxs - end_idxs) // block_size)
+            if consolidated is None:
+                consolidated = bool((n_blocks_per_file > 1).any())
+            file_idxs = np.repeat(np.arange(len(block_paths)), n_blocks_per_file)
+            file_offsets = np.repeat(
+                np.cumsum(n_blocks_per_file) - n_blocks_per_file, n_blocks_per_file
+            )
+            block_start_idxs = (
+                start_idxs[file_idxs] + (np.arange(len(file_idxs)) - file_offsets) * block_size
+            )
+            self.block_path_map = dict(
+                zip(block_start_idxs.tolist(), [block_paths[i] for i in file_idxs.tolist()])
+            )
+            self.max_idx = int(end_idxs.max())
         self.block_size = block_size
+        self.consolidated = bool(consolidated)
 
     def __str__(self) -> str:
         """Stringify the mapping.
@@ -333,7 +511,7 @@ class BlockPathMap:
         Returns:
             A string representation of this block path map.
         """
-        return "%d paths" % len(self.block_path_map)
+        return "%d paths" % len(set(self.block_path_map.values()))
 
     def __getitem__(self, idx: int) -> str:
         """Get block path from index.
@@ -347,3 +525,71 @@ class BlockPathMap:
         block_start_idx = self.block_size * (idx // self.block_size)
         block_path = self.block_path_map[block_start_idx]
         return block_path
+
+    def get_block_key(self, idx: int) -> Tuple[str, str]:
+        """Get block path and HDF5 group key from index.
+
+        Args:
+            idx (int): Index of sample.
+
+        Returns:
+            The path to the block file containing the sample index, and the key of the HDF5 group within that file that contains the block (the root group, '/', for non-consolidated files).
+        """
+        block_start_idx = self.block_size * (idx // self.block_size)
+        block_path = self.block_path_map[block_start_idx]
+        block_key = str(block_start_idx) if self.consolidated else "/"
+        return block_path, block_key
+
+
+def consolidate_blocks(dirname: str, output_dirname: str, block_size: int, group_size: int) -> None:
+    """Merge consecutive block files into fewer, larger files.
+
+    Each run of `group_size` consecutive block files in 'dirname' is written to
+    a single file in 'output_dirname', named '{start_idx}-{end_idx}.hdf5' after
+    the run's full range. Within this file, each original block is stored as
+    an HDF5 group, keyed by the block's start index, holding a copy of the
+    block's datasets. Reading the result with
+    `BlockPathMap.from_dir(output_dirname, block_size)` requires far fewer file
+    opens than reading the original block files.
+
+    The consolidated layout is detected by its files spanning more than one
+    block, so at least two blocks are merged into the first output file.
+
+    Args:
+        dirname (str): Path to directory containing block files.
+        output_dirname (str): Path to directory for saving consolidated block files.
+        block_size (int): Max number of samples per block file (e.g., 100000).
+        group_size (int): Number of consecutive blocks to merge per output file (at least 2).
+    """
+
+    assert group_size > 1, "group_size must be at least 2, found %d." % group_size
+
+    # Sorted blocks, which must cover a contiguous range.
+    block_path_map = BlockPathMap.from_dir(dirname, block_size)
+    blocks = sorted(block_path_map.block_path_map.items())
+    for (start_idx, _), (next_start_idx, next_path) in zip(blocks, blocks[1:]):
+        assert next_start_idx == start_idx + block_size, "missing block before '%s'." % next_path
+    assert len(blocks) > 1, "at least 2 blocks required for consolidation, found %d." % len(blocks)
+
+    os.makedirs(output_dirname, exist_ok=True)
+
+    for group_start in tqdm(range(0, len(blocks), group_size), "consolidating blocks."):
+        group_blocks = blocks[group_start : group_start + group_size]
+
+        # Output name spans the group's blocks, keeping their zero-padding.
+        first_name = os.path.splitext(os.path.basename(group_blocks[0][1]))[0]
+        last_name = os.path.splitext(os.path.basename(group_blocks[-1][1]))[0]
+        output_path = os.path.join(
+            output_dirname, "%s-%s.hdf5" % (first_name.split("-")[0], last_name.split("-")[1])
+        )
+
+        # Write to a temporary path first, so an interrupted run never leaves a
+        # partial file that looks complete.
+        tmp_path = output_path + ".tmp"
+        with h5py.File(tmp_path, "w") as f_out:
+            for start_idx, path in group_blocks:
+                block_group = f_out.create_group(str(start_idx))
+                with h5py.File(path, "r") as f_in:
+                    for key in f_in:
+                        f_in.copy(f_in[key], block_group, name=key)
+        os.replace(tmp_path, output_path)
@@ -131,6 +131,9 @@ class _HuggingFaceTokenizer(MegatronTokenizer):
     def detokenize(self, token_ids, **kwargs):
         return self._tokenizer.decode(token_ids, **kwargs)
 
+    def batch_detokenize(self, token_ids_list, **kwargs):
+        return self._tokenizer.batch_decode(token_ids_list, **kwargs)
+
     def offsets(self, ids: list[int], text: str) -> list[int]:
         retok_ids: "transformers.BatchEncoding" = self._tokenizer(text)
         offsets, next_start_idx = [], 0
@@ -507,6 +510,9 @@ class _GPTSentencePieceTokenizer(_SentencePieceTokenizer):
     def detokenize(self, ids):
         return self.tokenizer.decode_ids(ids)
 
+    def batch_detokenize(self, ids_list):
+        return self.tokenizer.decode_ids(ids_list)
+
     @property
     def cls(self):
         return -1
@@ -557,6 +563,9 @@ class _Llama2Tokenizer(_SentencePieceTokenizer):
     def detokenize(self, ids):
         return self.tokenizer.decode_ids(ids)
 
+    def batch_detokenize(self, ids_list):
+        return self.tokenizer.decode_ids(ids_list)
+
     @property
     def cls(self):
         return -1
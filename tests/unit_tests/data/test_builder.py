@@ -132,6 +132,22 @@ def test_builder():
         assert datasets[1] is None
         assert datasets[2] is None
 
+        config = BlendedMegatronDatasetConfig(
+            random_seed=1234,
+            sequence_length=_SEQUENCE_LENGTH,
+            blend_per_split=[
+                get_blend_from_list([paths[Split.train][0]]),
+                get_blend_from_list([paths[Split.train][0]]),
+                None,
+            ],
+        )
+        datasets = BlendedMegatronDatasetBuilder(
+            TestDataset, [1000, 100, None], lambda: True, config
+        ).build()
+        assert len(datasets[0]) == 1000 and len(datasets[1]) == 100
+        assert datasets[0].dataset is datasets[1].dataset
+        assert datasets[2] is None
+
         config = BlendedMegatronDatasetConfig(
             random_seed=1234,
             sequence_length=_SEQUENCE_LENGTH,
@@ -320,6 +336,19 @@ def test_builder():
         assert len(datasets[1]) == sum(_SIZES[Split.train]) / 2
         assert datasets[2] is None
 
+        config = BlendedMegatronDatasetConfig(
+            random_seed=1234,
+            sequence_length=_SEQUENCE_LENGTH,
+            blend=get_blend_from_list(["1", paths[Split.train][0]]),
+            split="100,0,0",
+        )
+        datasets = BlendedMegatronDatasetBuilder(
+            TestDataset, [1000, None, None], lambda: True, config
+        ).build()
+        assert len(datasets[0]) == 1000 and isinstance(datasets[0], TestDataset)
+        assert datasets[1] is None
+        assert datasets[2] is None
+
         # 990 9 1
         # 100000 1000 1
         # []
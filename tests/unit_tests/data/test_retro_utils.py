@@ -0,0 +1,205 @@
+import os
+import tempfile
+
+import numpy
+import pytest
+import torch
+
+# Retro preprocessing requires these libraries, which are installed in the CI
+# image (see Dockerfile.ci).
+for lib in ["faiss", "h5py", "transformers"]:
+    pytest.importorskip(lib)
+
+import h5py
+
+from megatron.core.datasets.retro.utils import (
+    Block,
+    BlockPathMap,
+    GPTToTextDataset,
+    consolidate_blocks,
+    get_blocks_by_rank,
+    iter_rank_blocks,
+    sample_blocks,
+)
+from tests.unit_tests.test_utilities import Utils
+
+
+def test_block_path_map():
+    block_size = 10
+
+    # Unsorted, zero-padded paths, with a final partial block.
+    block_paths = [
+        os.path.join("blocks", name) for name in ["010-020.hdf5", "020-025.hdf5", "000-010.hdf5"]
+    ]
+    block_path_map = BlockPathMap(block_paths, block_size)
+
+    assert block_path_map.max_idx == 25
+    assert str(block_path_map) == "3 paths"
+    for idx in range(block_path_map.max_idx):
+        start_idx = block_size * (idx // block_size)
+        end_idx = min(start_idx + block_size, 25)
+        expected_path = os.path.join("blocks", "%03d-%03d.hdf5" % (start_idx, end_idx))
+        assert block_path_map[idx] == expected_path
+        assert block_path_map.get_block_key(idx) == (expected_path, "/")
+
+    with pytest.raises(KeyError):
+        block_path_map[30]
+
+    # Empty directory.
+    block_path_map = BlockPathMap([], block_size)
+    assert block_path_map.max_idx == 0
+    assert block_path_map.block_path_map == {}
+    assert str(block_path_map) == "0 paths"
+
+
+def test_get_blocks_by_rank():
+    Utils.initialize_model_parallel()
+
+    block_size, n_samples = 25, 100
+
+    # Block names use the legacy zero-padding width, ceil(log10(n_samples)) + 1.
+    n_digits = int(numpy.ceil(numpy.log(n_samples) / numpy.log(10)) + 1)
+    assert n_digits == 3
+    block_names = [
+        "%s-%s.hdf5" % (str(i).zfill(n_digits), str(min(i + block_size, n_samples)).zfill(n_digits))
+        for i in range(0, n_samples, block_size)
+    ]
+
+    def validate(f):
+        assert f["data"].shape == (block_size,)
+
+    # Every rank creates the same files in its own directory: one valid block,
+    # one corrupt block, one invalid block, one missing block, and a non-block
+    # file.
+    with tempfile.TemporaryDirectory() as dirname:
+        valid_name, corrupt_name, invalid_name, missing_name = block_names
+        with h5py.File(os.path.join(dirname, valid_name), "w") as f:
+            f.create_dataset("data", data=numpy.zeros(block_size))
+        with open(os.path.join(dirname, corrupt_name), "wb") as f:
+            f.write(b"corrupt")
+        with h5py.File(os.path.join(dirname, invalid_name), "w") as f:
+            f.create_dataset("data", data=numpy.zeros(block_size - 1))
+        with open(os.path.join(dirname, "notes.txt"), "w") as f:
+            f.write("not a block")
+
+        blocks = get_blocks_by_rank(dirname, n_samples, block_size, validate)
+
+        # World split.
+        assert blocks.n_existing_world == 1
+        assert blocks.n_missing_world == 3
+        assert sum(blocks.n_existing_per_rank) == 1
+        assert sum(blocks.n_missing_per_rank) == 3
+
+        # This rank's split.
+        rank = torch.distributed.get_rank()
+        assert blocks.n_existing_per_rank[rank] == len(blocks.existing)
+        assert blocks.n_missing_per_rank[rank] == len(blocks.missing)
+        world_size = torch.distributed.get_world_size()
+        expected_existing = [valid_name][rank::world_size]
+        expected_missing = [corrupt_name, invalid_name, missing_name][rank::world_size]
+        assert [os.path.basename(b.path) for b in blocks.existing] == expected_existing
+        assert [os.path.basename(b.path) for b in blocks.missing] == expected_missing
+        for block in blocks.existing + blocks.missing:
+            idx = block_names.index(os.path.basename(block.path))
+            assert block.range == (idx * block_size, (idx + 1) * block_size)
+
+        # Only rank 0 deletes the corrupt and invalid blocks.
+        expected_names = {valid_name, "notes.txt"}
+        if rank != 0:
+            expected_names |= {corrupt_name, invalid_name}
+        assert set(os.listdir(dirname)) == expected_names
+
+    Utils.destroy_model_parallel()
+
+
+def test_consolidate_blocks(tmp_path):
+    block_size, n_samples = 4, 18
+    block_dir = os.path.join(tmp_path, "blocks")
+    os.mkdir(block_dir)
+    neighbors = numpy.arange(n_samples * 2).reshape(n_samples, 2)
+    for start_idx in range(0, n_samples, block_size):
+        end_idx = min(start_idx + block_size, n_samples)
+        block_path = os.path.join(block_dir, "%03d-%03d.hdf5" % (start_idx, end_idx))
+        with h5py.File(block_path, "w") as f:
+            f.create_dataset("neighbors", data=neighbors[start_idx:end_idx])
+
+    # Blocks are merged in pairs, with a final single block.
+    consolidated_dir = os.path.join(tmp_path, "consolidated")
+    consolidate_blocks(block_dir, consolidated_dir, block_size, group_size=2)
+    assert sorted(os.listdir(consolidated_dir)) == ["000-008.hdf5", "008-016.hdf5", "016-018.hdf5"]
+
+    # Both layouts are detected, and map every index to its neighbors.
+    for dirname, consolidated in [(block_dir, False), (consolidated_dir, True)]:
+        block_path_map = BlockPathMap.from_dir(dirname, block_size)
+        assert block_path_map.consolidated == consolidated
+        assert block_path_map.max_idx == n_samples
+        for idx in range(n_samples):
+            block_path, block_key = block_path_map.get_block_key(idx)
+            with h5py.File(block_path, "r") as f:
+                block_neighbors = f[block_key]["neighbors"][idx % block_size]
+            assert block_neighbors.tolist() == neighbors[idx].tolist()
+
+    with pytest.raises(AssertionError):
+        consolidate_blocks(block_dir, consolidated_dir, block_size, group_size=1)
+
+
+class _Tokenizer:
+    def detokenize(self, ids):
+        return " ".join(str(i) for i in ids)
+
+
+class _BatchTokenizer(_Tokenizer):
+    def __init__(self):
+        self.n_batch_calls = 0
+
+    def batch_detokenize(self, ids_list):
+        self.n_batch_calls += 1
+        return [self.detokenize(ids) for ids in ids_list]
+
+
+@pytest.mark.parametrize("tokenizer", [_Tokenizer(), _BatchTokenizer()])
+def test_gpt_to_text_dataset(tokenizer):
+    gpt_dataset = [{"text": numpy.arange(i, i + 3)} for i in range(5)]
+    text_dataset = GPTToTextDataset(gpt_dataset, tokenizer)
+
+    idxs = [3, 0, 4]
+    samples = text_dataset.__getitems__(idxs)
+    assert samples == [text_dataset[idx] for idx in idxs]
+    assert samples[0] == {"text": "3 4 5"}
+    if isinstance(tokenizer, _BatchTokenizer):
+        assert tokenizer.n_batch_calls == 1
+
+
+def _get_rank_blocks(n_blocks_per_rank):
+    return [
+        [Block((i, i + 1), "%d-%d.hdf5" % (rank, i)) for i in range(n_blocks)]
+        for rank, n_blocks in enumerate(n_blocks_per_rank)
+    ]
+
+
+@pytest.mark.parametrize("n_blocks_per_rank", [[3, 1, 0, 2], [0, 0], [2], []])
+def test_iter_rank_blocks(n_blocks_per_rank):
+    # All ranks must take the same number of steps, to stay in lockstep.
+    n_steps = max(n_blocks_per_rank, default=0)
+    for rank_blocks in _get_rank_blocks(n_blocks_per_rank):
+        rank_iter_blocks = list(iter_rank_blocks(rank_blocks, n_blocks_per_rank))
+        assert len(rank_iter_blocks) == n_steps
+        assert rank_iter_blocks[: len(rank_blocks)] == rank_blocks
+        assert all(block is None for block in rank_iter_blocks[len(rank_blocks) :])
+
+
+@pytest.mark.parametrize("sample", [0.01, 0.5, 1.0])
+@pytest.mark.parametrize("n_blocks_per_rank", [[7, 6, 6], [5, 0, 2], [0, 0], [4]])
+def test_sample_blocks(n_blocks_per_rank, sample):
+    world_rank_blocks = _get_rank_blocks(n_blocks_per_rank)
+    world_sampled = [
+        sample_blocks(rank_blocks, n_blocks_per_rank, sample) for rank_blocks in world_rank_blocks
+    ]
+    for rank_blocks, (sampled_blocks, n_sampled_per_rank) in zip(world_rank_blocks, world_sampled):
+        # Each rank's counts match every rank's sampled list lengths.
+        assert n_sampled_per_rank == [len(blocks) for blocks, _ in world_sampled]
+        assert len(set(map(id, sampled_blocks))) == len(sampled_blocks)
+        assert all(block in rank_blocks for block in sampled_blocks)
+        assert len(list(iter_rank_blocks(sampled_blocks, n_sampled_per_rank))) == max(
+            n_sampled_per_rank, default=0
+        )
@@ -191,3 +191,7 @@ def test_null_tokenizer():
         detok_str == test_string
     ), f"Detokenized string {detok_str} does not match original {test_string}"
     assert len(toks) == len(offsets), f"Tokenized string {toks} does not match original {offsets}"
+    assert tok.batch_detokenize([toks, toks[:2]]) == [
+        tok.detokenize(toks),
+        tok.detokenize(toks[:2]),
+    ]
@@ -36,10 +36,9 @@ class BertEmbeddingDataset(torch.utils.data.Dataset):
             "truncated" : 0,
         }
 
-    def __getitem__(self, idx):
+    def build_text_sample(self, text_sample):
 
         # Text.
-        text_sample = self.text_dataset[idx]
         text = text_sample["text"]
         text = text.replace("<|endoftext|>", "")
 
@@ -53,3 +52,15 @@ class BertEmbeddingDataset(torch.utils.data.Dataset):
         sample = self.build_sample(self.bert_tokenizer, bert_token_ids)
 
         return sample
+
+    def __getitem__(self, idx):
+        return self.build_text_sample(self.text_dataset[idx])
+
+    def __getitems__(self, idxs):
+        # Fetch text samples as a batch, if supported (e.g., for batched
+        # detokenization of GPT tokens).
+        if hasattr(self.text_dataset, "__getitems__"):
+            text_samples = self.text_dataset.__getitems__(idxs)
+        else:
+            text_samples = [ self.text_dataset[idx] for idx in idxs ]
+        return [ self.build_text_sample(s) for s in text_samples ]
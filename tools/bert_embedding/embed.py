@@ -12,7 +12,7 @@ from tqdm import tqdm
 from megatron.training import get_args, get_tokenizer, print_rank_0
 from megatron import core
 from megatron.training.arguments import core_transformer_config_from_args
-from megatron.core.datasets.retro.utils import get_blocks_by_rank
+from megatron.core.datasets.retro.utils import get_blocks_by_rank, iter_rank_blocks
 from megatron.core.enums import ModelType
 from megatron.core.pipeline_parallel import get_forward_backward_func
 from megatron.legacy.model import BertModel
@@ -225,21 +225,23 @@ class DiskDataParallelBertEmbedder:
         self.block_size = block_size
 
     def embed_text_blocks(self, name, dirname, text_dataset,
-                          missing_embedding_blocks):
+                          missing_embedding_blocks, n_missing_blocks_per_rank):
         '''Process a text dataset in blocks.'''
 
         # Iterate blocks.
-        for block_index, block_info in enumerate(missing_embedding_blocks):
+        n_missing_blocks = max(n_missing_blocks_per_rank, default=0)
+        for block_index, block_info in enumerate(
+                iter_rank_blocks(missing_embedding_blocks, n_missing_blocks_per_rank)):
 
-            # Missing block lists are extended with None to have equal-length
-            # lists. Skip the Nones.
+            # Block iteration is padded with None to have equal-length
+            # iteration across ranks. Skip the Nones.
             if block_info is not None:
 
                 # Progress. (*note*: move world progress to here.)
                 print_rank_0("embed '%s' block %d / %d ... %s." % (
                     name,
                     block_index,
-                    len(missing_embedding_blocks),
+                    n_missing_blocks,
                     block_info["path"],
                 ))
 
@@ -275,4 +277,5 @@ class DiskDataParallelBertEmbedder:
         torch.distributed.barrier()
 
         # Embed batches.
-        self.embed_text_blocks(name, dirname, text_dataset, blocks.missing)
+        self.embed_text_blocks(name, dirname, text_dataset, blocks.missing,
+                               blocks.n_missing_per_rank)